@@ -12,6 +12,33 @@ PASSWORD = os.getenv("MOODLE_PASSWORD", "YOUR_PASSWORD")
 
 # File System Configuration
 DOWNLOAD_FOLDER = os.getenv("MOODLE_DOWNLOAD_FOLDER", "moodle_downloads")
+NAME_MAP_FILENAME = ".moodle_names.json"  # Per-course URL -> filename mapping
+
+# Failure Queue Configuration
+FAILURE_QUEUE_PATH = os.getenv("MOODLE_FAILURE_QUEUE", os.path.join(DOWNLOAD_FOLDER, ".failed_downloads.json"))
+RETRY_PASSES = int(os.getenv("MOODLE_RETRY_PASSES", "2"))  # Deferred retry passes over failed files
+RETRY_PASS_BACKOFF = int(os.getenv("MOODLE_RETRY_PASS_BACKOFF", "10"))  # seconds, doubled each pass
+MAX_FAILURE_ATTEMPTS = int(os.getenv("MOODLE_MAX_FAILURE_ATTEMPTS", "10"))  # Park queued failures after this many attempts
+
+# Download Filters (comma-separated lists; empty values mean no restriction)
+FILTER_ALLOW_EXTENSIONS = [os.getenv("MOODLE_ALLOW_EXTENSIONS", "")]
+FILTER_DENY_EXTENSIONS = [os.getenv("MOODLE_DENY_EXTENSIONS", "")]
+FILTER_ALLOW_MIME_TYPES = [os.getenv("MOODLE_ALLOW_MIME_TYPES", "")]
+FILTER_DENY_MIME_TYPES = [os.getenv("MOODLE_DENY_MIME_TYPES", "")]
+FILTER_MAX_SIZE = os.getenv("MOODLE_MAX_SIZE", "")  # e.g. "20M"
+FILTER_SECTION_PATTERN = os.getenv("MOODLE_SECTION_PATTERN", "")  # Regex matched against section names
+FILTER_MODIFIED_AFTER = os.getenv("MOODLE_MODIFIED_AFTER", "")  # YYYY-MM-DD
+
+# Output Configuration
+OUTPUT_SINK = os.getenv("MOODLE_OUTPUT_SINK", "local")  # local, zip, tar or s3
+S3_BUCKET = os.getenv("MOODLE_S3_BUCKET", "")
+S3_PREFIX = os.getenv("MOODLE_S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("MOODLE_S3_ENDPOINT_URL")  # For S3-compatible stores such as MinIO
+
+# Search Index Configuration
+BUILD_SEARCH_INDEX = os.getenv("MOODLE_BUILD_INDEX", "0") == "1"  # Same as passing --index
+SEARCH_INDEX_PATH = os.getenv("MOODLE_SEARCH_INDEX", os.path.join(DOWNLOAD_FOLDER, ".search_index.db"))
+INDEX_WORKERS = int(os.getenv("MOODLE_INDEX_WORKERS", "0"))  # 0 means one worker per CPU
 
 # Logging Configuration
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
@@ -22,6 +49,7 @@ RETRY_ATTEMPTS = int(os.getenv("MOODLE_RETRY_ATTEMPTS", "3"))
 RETRY_BACKOFF_FACTOR = int(os.getenv("MOODLE_RETRY_BACKOFF", "1"))
 RETRY_STATUS_FORCELIST = [429, 500, 502, 503, 504]
 REQUEST_DELAY = int(os.getenv("MOODLE_REQUEST_DELAY", "1"))  # seconds
+MAX_BANDWIDTH = int(os.getenv("MOODLE_MAX_BANDWIDTH", "0"))  # bytes per second, 0 means unlimited
 
 # File Extensions
 MIME_TO_EXTENSION = {
@@ -45,6 +73,17 @@ MIME_TO_EXTENSION = {
     'application/json': '.json'
 }
 
+# Download priority classes (lower downloads first), matched against MIME type prefixes.
+# Types not listed here (PDFs, Office documents, text) use DEFAULT_DOWNLOAD_PRIORITY.
+DOWNLOAD_PRIORITY_CLASSES = {
+    'image/': 1,
+    'application/zip': 2,
+    'application/x-rar-compressed': 2,
+    'audio/': 3,
+    'video/': 3
+}
+DEFAULT_DOWNLOAD_PRIORITY = 0
+
 # File Signatures
 FILE_SIGNATURES = {
     b'%PDF': '.pdf',
@@ -2,6 +2,8 @@
 
 import sys
 import os
+import argparse
+import logging
 
 # Add the project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -10,14 +12,98 @@ from utils.logging_utils import setup_logging
 from utils.request_utils import create_session
 from services.auth_service import login, get_sesskey
 from services.course_service import get_course_ids
-from services.download_service import download_all_courses
+from services.download_service import download_all_courses, download_failed_files
+from services.index_service import update_index, find_indexable_files, search
+from utils.sink_utils import create_sink
+from utils.filter_utils import build_filters
+from config.config import (
+    BUILD_SEARCH_INDEX,
+    OUTPUT_SINK,
+    FILTER_ALLOW_EXTENSIONS,
+    FILTER_DENY_EXTENSIONS,
+    FILTER_ALLOW_MIME_TYPES,
+    FILTER_DENY_MIME_TYPES,
+    FILTER_MAX_SIZE,
+    FILTER_SECTION_PATTERN,
+    FILTER_MODIFIED_AFTER
+)
+# Imported through the src package so the timers share state with the services
+from src.utils.profiling_utils import run_profiled, log_timings
 
-def main():
-    """Main function to run the Moodle Downloader."""
-    # Set up logging
-    logger = setup_logging()
+def parse_args(argv):
+    """Parse command line arguments for a download run."""
+    parser = argparse.ArgumentParser(
+        description="Download all files from your Moodle courses.",
+        epilog="Use 'main.py search QUERY' to search previously indexed files."
+    )
+    parser.add_argument("course_ids", nargs="*", help="Course IDs to download (default: all courses)")
+    parser.add_argument("--index", action="store_true", default=BUILD_SEARCH_INDEX,
+                        help="Update the full-text search index with the downloaded files")
+    parser.add_argument("--output", choices=["local", "zip", "tar", "s3"], default=OUTPUT_SINK,
+                        help="Where to write files: loose files, one archive per course, or an S3 bucket")
+    filters = parser.add_argument_group("filters", "Skip files before any request is made for them")
+    filters.add_argument("--allow-ext", action="append", default=FILTER_ALLOW_EXTENSIONS, metavar="EXT",
+                         help="Only download these extensions, e.g. --allow-ext pdf --allow-ext pptx")
+    filters.add_argument("--deny-ext", action="append", default=FILTER_DENY_EXTENSIONS, metavar="EXT",
+                         help="Never download these extensions")
+    filters.add_argument("--allow-mime", action="append", default=FILTER_ALLOW_MIME_TYPES, metavar="TYPE",
+                         help="Only download these MIME types (wildcards like 'video/*' allowed)")
+    filters.add_argument("--deny-mime", action="append", default=FILTER_DENY_MIME_TYPES, metavar="TYPE",
+                         help="Never download these MIME types")
+    filters.add_argument("--max-size", default=FILTER_MAX_SIZE, metavar="SIZE",
+                         help="Skip files larger than this, e.g. 20M")
+    filters.add_argument("--section", default=FILTER_SECTION_PATTERN, metavar="PATTERN",
+                         help="Only download from course sections whose name matches this regex")
+    filters.add_argument("--modified-after", default=FILTER_MODIFIED_AFTER, metavar="YYYY-MM-DD",
+                         help="Skip files last modified before this date")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only retry downloads recorded as failed by previous runs")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run under cProfile, print a timing summary and write pstats output")
+    parser.add_argument("--profile-output", default="moodle_downloader.prof", metavar="FILE",
+                        help="Where --profile writes its pstats output (default: moodle_downloader.prof)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="With --profile, also report peak memory and top allocations via tracemalloc")
+    return parser.parse_args(argv)
+
+def parse_search_args(argv):
+    """Parse command line arguments for the search subcommand."""
+    parser = argparse.ArgumentParser(prog="main.py search", description="Search downloaded course files.")
+    parser.add_argument("query", nargs="+", help="Search terms (SQLite FTS5 query syntax)")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of results (default: 20)")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Index new or changed files in the download folder before searching")
+    return parser.parse_args(argv)
+
+def run_search(argv):
+    """Run the search subcommand."""
+    args = parse_search_args(argv)
+    if args.reindex:
+        update_index(find_indexable_files())
+    
+    results = search(" ".join(args.query), limit=args.limit)
+    for path, snippet in results:
+        print(f"{path}\n    {' '.join(snippet.split())}")
+    if not results:
+        print("No matches found.")
+
+def run_download(args, logger):
+    """Log in and download files from the requested courses."""
+    sink = None
     
     try:
+        # Create the output sink and filters first so configuration errors show up before logging in
+        sink = create_sink(args.output)
+        filters = build_filters(
+            allow_extensions=args.allow_ext,
+            deny_extensions=args.deny_ext,
+            allow_mime_types=args.allow_mime,
+            deny_mime_types=args.deny_mime,
+            max_size=args.max_size,
+            section_pattern=args.section,
+            modified_after=args.modified_after
+        )
+        
         # Create session with retry logic
         session = create_session()
         
@@ -26,32 +112,62 @@ def main():
             logger.error("Failed to login. Please check your credentials in config.py")
             return
         
-        # Get sesskey for AJAX requests
-        sesskey = get_sesskey(session)
-        if not sesskey:
-            logger.error("Failed to get sesskey")
-            return
-        
-        # Get course IDs (either from arguments or automatically)
-        if len(sys.argv) > 1:
-            try:
-                course_ids = [int(arg) for arg in sys.argv[1:]]
-                logger.info(f"Using provided course IDs: {course_ids}")
-            except ValueError:
-                logger.error("Invalid course IDs provided. Please use numbers only.")
-                return
+        if args.retry_failed:
+            # Retry only the persisted failures, without crawling any course pages
+            downloaded_paths = download_failed_files(session, sink, filters)
         else:
-            course_ids = get_course_ids(session, sesskey)
-            if not course_ids:
+            # Get sesskey for AJAX requests
+            sesskey = get_sesskey(session)
+            if not sesskey:
+                logger.error("Failed to get sesskey")
                 return
+            
+            # Get course IDs (either from arguments or automatically)
+            if args.course_ids:
+                try:
+                    course_ids = [int(arg) for arg in args.course_ids]
+                    logger.info(f"Using provided course IDs: {course_ids}")
+                except ValueError:
+                    logger.error("Invalid course IDs provided. Please use numbers only.")
+                    return
+            else:
+                course_ids = get_course_ids(session, sesskey)
+                if not course_ids:
+                    return
+            
+            # Download files from all courses
+            downloaded_paths = download_all_courses(session, course_ids, sink, filters)
         
-        # Download files from all courses
-        download_all_courses(session, course_ids)
+        # Index the files that were just written
+        if args.index:
+            if sink.stores_local_files:
+                update_index(downloaded_paths)
+            else:
+                logger.warning("Search indexing only works with --output local, skipping")
         
     except KeyboardInterrupt:
         logger.info("\nDownload interrupted by user")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+    finally:
+        if sink:
+            sink.close()
+
+def main():
+    """Main function to run the Moodle Downloader."""
+    # Set up logging
+    logger = setup_logging()
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "search":
+        run_search(sys.argv[2:])
+        return
+    
+    args = parse_args(sys.argv[1:])
+    if args.profile:
+        run_profiled(lambda: run_download(args, logger), args.profile_output, args.trace_memory)
+    else:
+        run_download(args, logger)
+        log_timings(logging.DEBUG)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
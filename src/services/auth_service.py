@@ -5,9 +5,11 @@ import re
 from bs4 import BeautifulSoup
 from config.config import LOGIN_URL, DASHBOARD_URL, USERNAME, PASSWORD
 from src.utils.request_utils import safe_request
+from src.utils.profiling_utils import timed
 
 logger = logging.getLogger(__name__)
 
+@timed("login")
 def login(session):
     """Log in to Moodle."""
     logger.info("Fetching login page...")
@@ -49,6 +51,7 @@ def login(session):
     logger.info("Login successful!")
     return True
 
+@timed("get_sesskey")
 def get_sesskey(session):
     """Extract sesskey from dashboard page."""
     logger.info("Getting sesskey...")
@@ -5,9 +5,11 @@ import json
 from bs4 import BeautifulSoup
 from config.config import BASE_URL
 from src.utils.request_utils import safe_request
+from src.utils.profiling_utils import timed
 
 logger = logging.getLogger(__name__)
 
+@timed("get_course_name")
 def get_course_name(session, course_id):
     """Get course name from course page."""
     course_url = f"{BASE_URL}/course/view.php?id={course_id}"
@@ -97,6 +99,7 @@ def get_course_ids_from_ajax(session, endpoint, sesskey):
     
     return course_ids
 
+@timed("get_course_ids")
 def get_course_ids(session, sesskey):
     """Get all available course IDs."""
     logger.info("Fetching course IDs...")
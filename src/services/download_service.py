@@ -5,13 +5,47 @@ import time
 import logging
 import urllib.parse
 import re
+import requests
 from bs4 import BeautifulSoup
-from config.config import BASE_URL, DOWNLOAD_FOLDER
-from src.utils.request_utils import safe_request
-from src.utils.file_utils import create_folder, get_best_filename, clean_filename
+from config.config import (
+    BASE_URL,
+    DOWNLOAD_FOLDER,
+    FAILURE_QUEUE_PATH,
+    RETRY_PASSES,
+    RETRY_PASS_BACKOFF
+)
+from src.utils.request_utils import safe_request, bandwidth_limiter
+from src.utils.profiling_utils import timed
+from src.utils.url_utils import canonicalize_url, get_resource_revision
+from src.utils.failure_utils import (
+    load_failures,
+    save_failures,
+    record_failure,
+    failure_key,
+    describe_error
+)
+from src.utils.filter_utils import (
+    build_filters,
+    needs_metadata,
+    get_mime_type_from_icon,
+    rejects_type,
+    rejects_section,
+    rejects_metadata
+)
+from src.utils.file_utils import (
+    create_folder,
+    get_best_filename,
+    clean_filename,
+    reserve_filename,
+    get_download_priority
+)
+from src.utils.sink_utils import LocalDirectorySink
 
 logger = logging.getLogger(__name__)
 
+# Link text like "Week 1. Intro" yields a bogus extension from os.path.splitext
+EXTENSION_PATTERN = re.compile(r'\.[A-Za-z0-9]{1,5}')
+
 def get_file_extension_from_url(url):
     """Extract file extension from URL or content type"""
     parsed_url = urllib.parse.urlparse(url)
@@ -47,6 +81,7 @@ def get_file_extension_from_headers(headers):
     }
     return mime_to_ext.get(content_type, '')
 
+@timed("get_course_name")
 def get_course_name(session, course_id):
     """Get course name from course ID."""
     course_url = f"{BASE_URL}/course/view.php?id={course_id}"
@@ -120,34 +155,203 @@ def get_actual_file_url(session, view_url):
         logger.error(f"Error getting actual file URL: {str(e)}")
         return None
 
-def download_course_files(session, course_id):
-    """Download all files from a course"""
+def iter_throttled_chunks(response, chunk_size=8192):
+    """Yield response chunks, pacing them under the global bandwidth cap."""
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if chunk:
+            bandwidth_limiter.consume(len(chunk))
+            yield chunk
+
+@timed("transfer")
+def download_file(session, sink, job):
+    """Stream a single file straight into the output sink. Returns its location, or None on failure."""
+    filename = job["filename"]
+    logging.info(f"Downloading: {filename}")
+    
+    file_response = safe_request(session, "GET", job["url"], stream=True)
+    if not file_response:
+        return None
+    
+    if file_response.status_code != 200:
+        logging.error(f"Failed to download {filename}: {file_response.status_code}")
+        return None
+    
+    # Size the entry from this response, not the cached HEAD (the file may have been replaced since);
+    # Content-Length only matches the streamed bytes when the body is not content-encoded
+    content_length = file_response.headers.get("content-length", "")
+    size = None
+    if content_length.isdigit() and "content-encoding" not in file_response.headers:
+        size = int(content_length)
+    location = sink.write(job["course_name"], filename, iter_throttled_chunks(file_response), size=size)
+    logging.info(f"Successfully downloaded: {filename}")
+    return location
+
+def get_filter_extension(*candidates):
+    """Return the first candidate that looks like a real file extension (ignoring .php)."""
+    for extension in candidates:
+        if extension and EXTENSION_PATTERN.fullmatch(extension) and extension.lower() != '.php':
+            return extension.lower()
+    return ''
+
+def get_section_name(link):
+    """Get the name of the course section a link appears in, if any."""
+    section = link.find_parent(attrs={"data-sectionname": True})
+    if section:
+        return section["data-sectionname"]
+    section = link.find_parent("li", class_="section")
+    if section:
+        heading = section.find(class_="sectionname")
+        if heading:
+            return heading.get_text().strip()
+        return section.get("aria-label", "")
+    return None
+
+def get_file_metadata(head_response):
+    """Extract the metadata cached in the name map from a HEAD response."""
+    content_length = head_response.headers.get('content-length')
+    return {
+        "content_type": head_response.headers.get('content-type'),
+        "size": int(content_length) if content_length and content_length.isdigit() else None,
+        "last_modified": head_response.headers.get('last-modified'),
+        "revision": get_resource_revision(head_response.url)
+    }
+
+def make_download_job(file_url, course_id, course_name, filename, content_type=None, size=None):
+    """Describe a pending transfer along with its scheduling priority."""
+    return {
+        "url": file_url,
+        "course_id": course_id,
+        "course_name": course_name,
+        "filename": filename,
+        "priority": get_download_priority(filename, content_type),
+        "size": size
+    }
+
+def download_priority_key(job):
+    """Sort key: priority class first, then smallest known size, unknown sizes last."""
+    return (job["priority"], job["size"] is None, job["size"] or 0)
+
+def discover_course_files(session, course_id, sink, seen_urls=None, failures=None, filters=None):
+    """Find all files in a course and pick their target names. Returns a list of download jobs.
+    
+    seen_urls holds canonical URLs already claimed in this run; links to a file
+    that is already in it (from this or another course) are skipped. Files whose
+    HEAD request fails are added to failures instead of being returned.
+    
+    filters are checked against the link, its section and cached metadata
+    before any request; a HEAD is only made for files not seen before, or
+    when a size/date filter needs metadata that is not cached or is out of
+    date because the link points to a newer revision of the file.
+    """
     course_url = f"{BASE_URL}/course/view.php?id={course_id}"
+    seen_urls = set() if seen_urls is None else seen_urls
+    failures = {} if failures is None else failures
+    filters = build_filters() if filters is None else filters
+    jobs = []
     
     try:
-        course_name = get_course_name(session, course_id)
+        course_name = clean_filename(get_course_name(session, course_id))
         logging.info(f"\nProcessing: {course_name} (ID: {course_id})")
         
-        course_folder = os.path.join(DOWNLOAD_FOLDER, clean_filename(course_name))
-        create_folder(course_folder)
-        
         course_page = safe_request(session, "GET", course_url)
         if not course_page:
             logging.error("Failed to fetch course page")
-            return
+            return jobs
             
-        soup = BeautifulSoup(course_page.text, "html.parser")
-        
         # Find all links
-        links = soup.find_all("a", href=True)
+        with timed("link_extraction"):
+            soup = BeautifulSoup(course_page.text, "html.parser")
+            links = soup.find_all("a", href=True)
+        
+        # Scan the course output once; naming below only consults these in-memory indexes
+        with timed("name_index"):
+            existing_names = sink.existing_names(course_name)
+            name_map = sink.load_name_map(course_name)
+            name_index = existing_names | {os.path.normcase(entry["name"]) for entry in name_map.values()}
+        
         logging.debug(f"Found {len(links)} total links in course page")
         
-        file_count = 0
         for link in links:
             file_url = link["href"]
             
             if "pluginfile.php" in file_url or "/resource/" in file_url:
                 try:
+                    # Get file URL
+                    if not file_url.startswith("http"):
+                        file_url = urllib.parse.urljoin(BASE_URL, file_url)
+                    
+                    # Fetch each distinct file once, however many times it is linked
+                    canonical_url = canonicalize_url(file_url)
+                    if canonical_url in seen_urls:
+                        logging.debug(f"Skipping duplicate link: {file_url}")
+                        continue
+                    
+                    # Links rejected by their own section or icon don't claim the URL,
+                    # so another link to the same file can still pass
+                    reason = rejects_section(filters, get_section_name(link))
+                    if reason:
+                        logging.info(f"Skipping {file_url}: {reason}")
+                        continue
+                    icon_mime_type = get_mime_type_from_icon(link)
+                    
+                    # Reuse the name this URL was saved under on a previous run
+                    # (maps written before URLs were canonicalized are keyed by the raw URL)
+                    mapped = name_map.get(canonical_url) or name_map.pop(file_url, None)
+                    if mapped and mapped.get("provisional"):
+                        # Named after a failed HEAD, so the extension was a guess: look the file up
+                        # again, freeing the placeholder name unless something was saved under it
+                        name_map.pop(canonical_url, None)
+                        if os.path.normcase(mapped["name"]) not in existing_names:
+                            name_index.discard(os.path.normcase(mapped["name"]))
+                        mapped = None
+                    if mapped:
+                        name_map[canonical_url] = mapped
+                        
+                        # Filter on cached metadata; only ask the server if a size/date filter needs it
+                        mapped_ext = get_filter_extension(os.path.splitext(mapped["name"])[1])
+                        reason = rejects_type(filters, mapped_ext, mapped.get("content_type") or icon_mime_type)
+                        if reason:
+                            logging.info(f"Skipping {mapped['name']}: {reason}")
+                            continue
+                        
+                        resolved_url = mapped.get("resolved_url")
+                        if resolved_url and resolved_url != canonical_url:
+                            if resolved_url in seen_urls:
+                                logging.debug(f"Skipping duplicate link: {file_url}")
+                                continue
+                            seen_urls.add(resolved_url)
+                        seen_urls.add(canonical_url)
+                        
+                        # A newer revision in the link means the file was replaced since it was cached
+                        link_revision = get_resource_revision(file_url)
+                        stale = "size" not in mapped or (
+                            link_revision is not None and link_revision != mapped.get("revision")
+                        )
+                        if needs_metadata(filters) and stale:
+                            head_response = safe_request(session, "HEAD", file_url)
+                            if head_response:
+                                mapped.update(get_file_metadata(head_response))
+                        reason = rejects_metadata(filters, mapped.get("size"), mapped.get("last_modified"))
+                        if reason and not stale and link_revision is None:
+                            # Links without a revision can't show a replaced file, so ask before skipping
+                            head_response = safe_request(session, "HEAD", file_url)
+                            if head_response:
+                                mapped.update(get_file_metadata(head_response))
+                                reason = rejects_metadata(filters, mapped.get("size"), mapped.get("last_modified"))
+                        if reason:
+                            logging.info(f"Skipping {mapped['name']}: {reason}")
+                            continue
+                        
+                        jobs.append(make_download_job(
+                            file_url,
+                            course_id,
+                            course_name,
+                            mapped["name"],
+                            content_type=mapped.get("content_type"),
+                            size=mapped.get("size")
+                        ))
+                        continue
+                    
                     # Get filename from different sources
                     file_name = None
                     
@@ -182,21 +386,43 @@ def download_course_files(session, course_id):
                     
                     # Ensure we have a valid filename
                     if not file_name or file_name.lower() in ['click', 'download', 'file', 'pluginfile.php']:
-                        file_name = f"file_{int(time.time())}_{file_count}"
+                        file_name = f"file_{int(time.time())}_{len(jobs)}"
                     
                     # Clean the base filename
                     file_name = clean_filename(file_name)
                     base_name, existing_ext = os.path.splitext(file_name)
                     
-                    # Get file URL
-                    if not file_url.startswith("http"):
-                        file_url = urllib.parse.urljoin(BASE_URL, file_url)
+                    # Filter on what the link tells us before making any request
+                    link_ext = get_filter_extension(existing_ext, get_file_extension_from_url(file_url))
+                    reason = rejects_type(filters, link_ext, icon_mime_type)
+                    if reason:
+                        logging.info(f"Skipping {file_name}: {reason}")
+                        continue
+                    seen_urls.add(canonical_url)
                     
                     # Make HEAD request to get headers
-                    head_response = safe_request(session, "HEAD", file_url)
-                    if not head_response:
+                    try:
+                        head_response = safe_request(session, "HEAD", file_url, raise_errors=True)
+                    except requests.exceptions.RequestException as e:
+                        # Keep a name for it so a later retry can fetch it without re-crawling
+                        fallback_ext = existing_ext or get_file_extension_from_url(file_url)
+                        if fallback_ext.lower() == '.php':
+                            fallback_ext = ''
+                        final_filename = reserve_filename(name_index, base_name, fallback_ext)
+                        name_map[canonical_url] = {"name": final_filename, "provisional": True}
+                        job = make_download_job(file_url, course_id, course_name, final_filename)
+                        job["provisional"] = True
+                        record_failure(failures, job, describe_error(e))
                         continue
                     
+                    # Resource view links redirect to the file itself, which may also be linked directly
+                    resolved_url = canonicalize_url(head_response.url)
+                    if resolved_url != canonical_url:
+                        if resolved_url in seen_urls:
+                            logging.debug(f"Skipping duplicate link: {file_url} -> {head_response.url}")
+                            continue
+                        seen_urls.add(resolved_url)
+                    
                     # Get extension from multiple sources
                     url_ext = get_file_extension_from_url(file_url)
                     content_ext = get_file_extension_from_headers(head_response.headers)
@@ -226,53 +452,229 @@ def download_course_files(session, course_id):
                                 elif file_start.startswith(b'\x89PNG'):
                                     final_ext = '.png'
                     
-                    # Construct final filename with extension
-                    final_filename = base_name + (final_ext if final_ext else '')
-                    file_path = os.path.join(course_folder, final_filename)
-                    
-                    # Handle duplicate filenames
-                    counter = 1
-                    while os.path.exists(file_path):
-                        new_filename = f"{base_name}_{counter}{final_ext}"
-                        file_path = os.path.join(course_folder, new_filename)
-                        counter += 1
+                    # Pick a name that is free in this folder and remember it for this URL,
+                    # along with the metadata later runs can filter on without a HEAD
+                    final_filename = reserve_filename(name_index, base_name, final_ext or '')
+                    metadata = get_file_metadata(head_response)
+                    name_map[canonical_url] = dict(metadata, name=final_filename, resolved_url=resolved_url)
                     
-                    logging.info(f"Downloading: {os.path.basename(file_path)}")
-                    
-                    # Download the file
-                    file_response = safe_request(session, "GET", file_url, stream=True)
-                    if not file_response:
+                    reason = (
+                        rejects_type(filters, get_filter_extension(final_ext), metadata["content_type"])
+                        or rejects_metadata(filters, metadata["size"], metadata["last_modified"])
+                    )
+                    if reason:
+                        logging.info(f"Skipping {final_filename}: {reason}")
                         continue
                     
-                    if file_response.status_code == 200:
-                        with open(file_path, "wb") as f:
-                            for chunk in file_response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    f.write(chunk)
-                        logging.info(f"Successfully downloaded: {os.path.basename(file_path)}")
-                        file_count += 1
-                    else:
-                        logging.error(f"Failed to download {os.path.basename(file_path)}: {file_response.status_code}")
+                    jobs.append(make_download_job(
+                        file_url,
+                        course_id,
+                        course_name,
+                        final_filename,
+                        content_type=metadata["content_type"],
+                        size=metadata["size"]
+                    ))
                 
                 except Exception as e:
-                    logging.error(f"Error downloading file: {str(e)}")
+                    logging.error(f"Error inspecting file: {str(e)}")
                     continue
         
-        logging.info(f"Downloaded {file_count} files from {course_name}")
+        sink.save_name_map(course_name, name_map)
+        logging.info(f"Found {len(jobs)} files in {course_name}")
         
     except Exception as e:
         logging.error(f"Error processing course {course_id}: {str(e)}")
+    
+    return jobs
+
+def download_jobs(session, sink, jobs, failures=None):
+    """Download jobs in priority order (documents and small files first). Returns the locations written.
+    
+    Failed jobs are recorded in failures and removed from it once they succeed.
+    """
+    failures = {} if failures is None else failures
+    downloaded_paths = []
+    for job in sorted(jobs, key=download_priority_key):
+        try:
+            location = download_file(session, sink, job)
+            error = None if location else "DownloadFailed"
+        except Exception as e:
+            logging.error(f"Error downloading file: {str(e)}")
+            location, error = None, describe_error(e)
+        
+        if location:
+            downloaded_paths.append(location)
+            failures.pop(failure_key(job), None)
+        else:
+            record_failure(failures, job, error)
+    return downloaded_paths
+
+def resolve_queued_job(session, sink, job, filters):
+    """Complete a queued job whose discovery HEAD failed, then check it against the filters.
+    
+    The HEAD picks the extension its placeholder name lacked and records the
+    file's metadata in the course's name map. Returns the updated job, or None
+    if the filters reject it. Raises RequestException if the HEAD fails again.
+    """
+    course_name = job["course_name"]
+    canonical_url = failure_key(job)
+    name_map = sink.load_name_map(course_name)
+    mapped = name_map.get(canonical_url)
+    
+    # A later discovery may already have looked the file up
+    if not mapped or mapped.get("provisional"):
+        head_response = safe_request(session, "HEAD", job["url"], raise_errors=True)
+        base_name, extension = os.path.splitext(job["filename"])
+        if not get_filter_extension(extension):
+            base_name = job["filename"]
+            extension = (
+                get_filter_extension(get_file_extension_from_url(head_response.url))
+                or get_file_extension_from_headers(head_response.headers)
+            )
+        name_index = sink.existing_names(course_name) | {
+            os.path.normcase(entry["name"]) for key, entry in name_map.items() if key != canonical_url
+        }
+        mapped = dict(
+            get_file_metadata(head_response),
+            name=reserve_filename(name_index, base_name, extension),
+            resolved_url=canonicalize_url(head_response.url)
+        )
+        name_map[canonical_url] = mapped
+        sink.save_name_map(course_name, name_map)
+    
+    reason = (
+        rejects_type(filters, get_filter_extension(os.path.splitext(mapped["name"])[1]), mapped.get("content_type"))
+        or rejects_metadata(filters, mapped.get("size"), mapped.get("last_modified"))
+    )
+    if reason:
+        logging.info(f"Skipping {mapped['name']}: {reason}")
+        return None
+    return make_download_job(
+        job["url"],
+        job["course_id"],
+        course_name,
+        mapped["name"],
+        content_type=mapped.get("content_type"),
+        size=mapped.get("size")
+    )
 
-def download_all_courses(session, course_ids):
-    """Download files from all courses."""
+def download_queued_jobs(session, sink, failures, urls, filters):
+    """Download the given queued failures, completing provisional ones first. Returns the locations written.
+    
+    Entries the filters reject are dropped from failures.
+    """
+    jobs = []
+    for url in urls:
+        entry = failures[url]
+        if entry.get("provisional"):
+            try:
+                job = resolve_queued_job(session, sink, entry, filters)
+            except requests.exceptions.RequestException as e:
+                record_failure(failures, entry, describe_error(e))
+                continue
+            if job is None:
+                del failures[url]
+                continue
+            entry.update(job)
+            del entry["provisional"]
+        jobs.append(entry)
+    return download_jobs(session, sink, jobs, failures)
+
+def retry_failed_downloads(session, sink, failures, urls=None, passes=RETRY_PASSES, filters=None):
+    """Retry queued failures (all, or only the given URLs) with exponential backoff between passes.
+    
+    Returns the locations written. Jobs that still fail stay in failures;
+    parked entries are skipped.
+    """
+    filters = build_filters() if filters is None else filters
+    
+    def still_pending(url):
+        return url in failures and not failures[url].get("parked")
+    
+    pending = [url for url in (failures if urls is None else urls) if still_pending(url)]
+    downloaded_paths = []
+    for retry_pass in range(passes):
+        if not pending:
+            break
+        delay = RETRY_PASS_BACKOFF * (2 ** retry_pass)
+        logger.info(f"\nRetrying {len(pending)} failed downloads in {delay}s (pass {retry_pass + 1}/{passes})")
+        time.sleep(delay)
+        downloaded_paths.extend(download_queued_jobs(session, sink, failures, pending, filters))
+        pending = [url for url in pending if still_pending(url)]
+    
+    if pending:
+        logger.warning(f"{len(pending)} downloads still failing; run with --retry-failed to try them again")
+    return downloaded_paths
+
+def download_course_files(session, course_id, sink=None, filters=None):
+    """Download all files from a course into the sink (loose local files by default).
+    
+    Returns the locations of the files written.
+    """
+    sink = sink or LocalDirectorySink()
+    failures = {}
+    jobs = discover_course_files(session, course_id, sink, failures=failures, filters=filters)
+    downloaded_paths = download_jobs(session, sink, jobs, failures)
+    downloaded_paths.extend(retry_failed_downloads(session, sink, failures, filters=filters))
+    logging.info(f"Downloaded {len(downloaded_paths)} files from course {course_id}")
+    return downloaded_paths
+
+def download_all_courses(session, course_ids, sink=None, filters=None):
+    """Download files from all courses into the sink. Returns the locations of all files written.
+    
+    Files that fail are retried at the end of the run and any that still fail
+    are kept in the persistent failure queue for --retry-failed.
+    """
+    sink = sink or LocalDirectorySink()
     logger.info("\nStarting file downloads...")
     
     # Create downloads folder
     create_folder(DOWNLOAD_FOLDER)
     
-    # Download files from each course
-    for course_id in course_ids:
-        download_course_files(session, course_id)
-        time.sleep(2)  # Add delay between processing courses
+    failures = load_failures()
+    previous_failures = set(failures)
+    downloaded_paths = []
+    try:
+        # Discover files in every course first so transfers can be prioritised across courses
+        # A file linked from several pages or courses is only fetched for the first one
+        jobs = []
+        seen_urls = set()
+        for course_id in course_ids:
+            jobs.extend(discover_course_files(session, course_id, sink, seen_urls, failures, filters))
+            time.sleep(2)  # Add delay between processing courses
+        
+        downloaded_paths.extend(download_jobs(session, sink, jobs, failures))
+        
+        # Deferred retry of this run's failures; older entries wait for --retry-failed
+        new_failures = [url for url in failures if url not in previous_failures]
+        downloaded_paths.extend(retry_failed_downloads(session, sink, failures, new_failures, filters=filters))
+    finally:
+        save_failures(failures)
+    
+    logger.info(f"\nDownloaded {len(downloaded_paths)} of {len(jobs)} files")
+    logger.info("\nDownload process completed!")
+    return downloaded_paths
+
+def download_failed_files(session, sink=None, filters=None):
+    """Retry only the downloads in the persistent failure queue. Returns the locations written."""
+    sink = sink or LocalDirectorySink()
+    filters = build_filters() if filters is None else filters
+    failures = load_failures()
+    pending = [url for url, entry in failures.items() if not entry.get("parked")]
+    parked = len(failures) - len(pending)
+    if parked:
+        logger.info(f"Skipping {parked} parked downloads that failed too often (see {FAILURE_QUEUE_PATH})")
+    if not pending:
+        logger.info("No failed downloads to retry")
+        return []
+    
+    logger.info(f"\nRetrying {len(pending)} downloads from the failure queue...")
+    try:
+        downloaded_paths = download_queued_jobs(session, sink, failures, pending, filters)
+        downloaded_paths.extend(retry_failed_downloads(session, sink, failures, filters=filters))
+    finally:
+        save_failures(failures)
     
-    logger.info("\nDownload process completed!") 
\ No newline at end of file
+    still_failing = sum(1 for entry in failures.values() if not entry.get("parked"))
+    logger.info(f"\nRecovered {len(downloaded_paths)} files, {still_failing} still failing")
+    return downloaded_paths
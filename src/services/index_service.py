@@ -0,0 +1,199 @@
+"""Search index service for full-text search over downloaded files."""
+
+import os
+import re
+import hashlib
+import logging
+import sqlite3
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from config.config import DOWNLOAD_FOLDER, SEARCH_INDEX_PATH, INDEX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.json', '.py', '.c', '.cpp', '.java', '.tex'}
+HTML_EXTENSIONS = {'.html', '.htm'}
+OFFICE_XML_PARTS = {
+    '.docx': re.compile(r'^word/(document|footnotes|endnotes)\.xml$'),
+    '.pptx': re.compile(r'^ppt/(slides/slide|notesSlides/notesSlide)\d+\.xml$'),
+    '.xlsx': re.compile(r'^xl/sharedStrings\.xml$')
+}
+INDEXABLE_EXTENSIONS = TEXT_EXTENSIONS | HTML_EXTENSIONS | set(OFFICE_XML_PARTS) | {'.pdf'}
+
+def extract_pdf_text(path):
+    """Extract text from a PDF using pypdf, if it is installed."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.debug(f"pypdf is not installed, skipping {path}")
+        return ""
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+def extract_office_xml_text(path, part_pattern):
+    """Extract text from the XML parts of a docx/pptx/xlsx archive."""
+    texts = []
+    with zipfile.ZipFile(path) as archive:
+        for part in sorted(archive.namelist()):
+            if not part_pattern.match(part):
+                continue
+            root = ET.fromstring(archive.read(part))
+            texts.extend(element.text for element in root.iter() if element.text)
+    return " ".join(texts)
+
+def extract_html_text(path):
+    """Extract visible text from an HTML file."""
+    from bs4 import BeautifulSoup
+    with open(path, "rb") as f:
+        return BeautifulSoup(f.read(), "html.parser").get_text(" ")
+
+def extract_text(path):
+    """Extract searchable text from a file. Returns (path, text) so it can run in a worker process."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.pdf':
+            return path, extract_pdf_text(path)
+        if ext in OFFICE_XML_PARTS:
+            return path, extract_office_xml_text(path, OFFICE_XML_PARTS[ext])
+        if ext in HTML_EXTENSIONS:
+            return path, extract_html_text(path)
+        if ext in TEXT_EXTENSIONS:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                return path, f.read()
+    except Exception as e:
+        logger.warning(f"Could not extract text from {path}: {str(e)}")
+    return path, ""
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_and_extract(path, known_hash=None):
+    """Hash a file and extract its text unless the hash matches known_hash.
+
+    Returns (path, content_hash, text), with text None for unchanged files.
+    """
+    try:
+        content_hash = hash_file(path)
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {str(e)}")
+        return path, None, None
+    if content_hash == known_hash:
+        return path, content_hash, None
+    return path, content_hash, extract_text(path)[1]
+
+def connect_index(index_path=SEARCH_INDEX_PATH):
+    """Open the search index database, creating its tables if needed."""
+    folder = os.path.dirname(index_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, content_hash TEXT)"
+    )
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(path UNINDEXED, content)")
+    # Indexes created before content hashes were tracked lack the column
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+    return conn
+
+def find_indexable_files(folder=DOWNLOAD_FOLDER):
+    """Walk a folder and return all files that can be indexed.
+
+    Hidden files are skipped: they are the downloader's own name maps,
+    failure queue and index, not course material.
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            if os.path.splitext(filename)[1].lower() in INDEXABLE_EXTENSIONS:
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+def prune_index(conn):
+    """Remove index entries for files that no longer exist. Returns how many were removed."""
+    missing = [path for (path,) in conn.execute("SELECT path FROM files") if not os.path.exists(path)]
+    for path in missing:
+        conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+    return len(missing)
+
+def update_index(paths, index_path=SEARCH_INDEX_PATH):
+    """Index new or changed files and drop files that were deleted. Text extraction runs in a process pool.
+
+    Files whose size and modification time match the index are skipped outright;
+    otherwise the file is hashed and only re-extracted if its content changed,
+    since every download rewrites the file even when nothing in it changed.
+    """
+    conn = connect_index(index_path)
+    try:
+        removed = prune_index(conn)
+        if removed:
+            logger.info(f"Removed {removed} deleted files from the search index")
+
+        pending = {}
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.splitext(path)[1].lower() not in INDEXABLE_EXTENSIONS:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            row = conn.execute("SELECT mtime_ns, size, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+            if row is None or row[:2] != (stat.st_mtime_ns, stat.st_size):
+                pending[path] = (stat, row[2] if row else None)
+
+        indexed = 0
+        if pending:
+            with ProcessPoolExecutor(max_workers=INDEX_WORKERS or None) as executor:
+                known_hashes = [known_hash for _, known_hash in pending.values()]
+                for path, content_hash, text in executor.map(hash_and_extract, pending, known_hashes, chunksize=8):
+                    if content_hash is None:
+                        continue
+                    stat = pending[path][0]
+                    if text is not None:
+                        conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+                        conn.execute("INSERT INTO documents (path, content) VALUES (?, ?)", (path, text))
+                        indexed += 1
+                    conn.execute(
+                        "INSERT OR REPLACE INTO files (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?)",
+                        (path, stat.st_mtime_ns, stat.st_size, content_hash)
+                    )
+        conn.commit()
+
+        if indexed:
+            logger.info(f"Indexed {indexed} new or changed files into {index_path}")
+        else:
+            logger.info("Search index is up to date")
+        return indexed
+    finally:
+        conn.close()
+
+def search(query, limit=20, index_path=SEARCH_INDEX_PATH):
+    """Search the index. Returns a list of (path, snippet) tuples, best matches first."""
+    if not os.path.exists(index_path):
+        logger.error(f"No search index found at {index_path}. Run a download with --index first.")
+        return []
+
+    conn = connect_index(index_path)
+    try:
+        return conn.execute(
+            "SELECT path, snippet(documents, 1, '[', ']', '...', 12) FROM documents "
+            "WHERE documents MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit)
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.error(f"Invalid search query '{query}': {str(e)}")
+        return []
+    finally:
+        conn.close()
@@ -0,0 +1,60 @@
+"""Persistent queue of failed downloads for the Moodle Downloader."""
+
+import os
+import json
+import time
+import logging
+from config.config import FAILURE_QUEUE_PATH, MAX_FAILURE_ATTEMPTS
+from src.utils.url_utils import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+def failure_key(job):
+    """Queue key for a job: its canonical URL, so any link to the same file matches."""
+    return canonicalize_url(job["url"])
+
+def load_failures(queue_path=FAILURE_QUEUE_PATH):
+    """Load the failure queue as {canonical url: entry}."""
+    try:
+        with open(queue_path, "r", encoding="utf-8") as f:
+            failures = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    # Queues saved before keys were canonicalized are keyed by the raw URL
+    return {failure_key(entry): entry for entry in failures.values()}
+
+def save_failures(failures, queue_path=FAILURE_QUEUE_PATH):
+    """Save the failure queue, removing the file once it is empty."""
+    if not failures:
+        if os.path.exists(queue_path):
+            os.remove(queue_path)
+        return
+    folder = os.path.dirname(queue_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = queue_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(failures, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, queue_path)
+
+def describe_error(error):
+    """Describe an exception for the queue, e.g. 'HTTPError 404' or 'ConnectionError'."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"{type(error).__name__} {response.status_code}"
+    return type(error).__name__
+
+def record_failure(failures, job, error, max_attempts=MAX_FAILURE_ATTEMPTS):
+    """Add a failed download job to the queue, or bump its attempt count.
+    
+    Entries that reach max_attempts are parked: kept in the queue for reference
+    but no longer retried until a normal run downloads the file successfully.
+    """
+    entry = failures.setdefault(failure_key(job), dict(job, attempts=0))
+    entry["attempts"] += 1
+    entry["error"] = error
+    entry["last_failed"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    if max_attempts and entry["attempts"] >= max_attempts and not entry.get("parked"):
+        entry["parked"] = True
+        logger.warning(f"Giving up on {entry['filename']} after {entry['attempts']} attempts ({error})")
+    return entry
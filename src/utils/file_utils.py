@@ -1,13 +1,55 @@
 """File handling utilities for the Moodle Downloader."""
 
 import os
+import json
 import urllib.parse
-from config.config import INVALID_FILENAME_CHARS, MIME_TO_EXTENSION, FILE_SIGNATURES
+from config.config import (
+    INVALID_FILENAME_CHARS,
+    MIME_TO_EXTENSION,
+    FILE_SIGNATURES,
+    DOWNLOAD_PRIORITY_CLASSES,
+    DEFAULT_DOWNLOAD_PRIORITY
+)
+
+EXTENSION_TO_MIME = {ext: mime for mime, ext in MIME_TO_EXTENSION.items()}
 
 def create_folder(path):
     """Create a folder if it doesn't exist."""
     os.makedirs(path, exist_ok=True)
 
+def build_filename_index(folder):
+    """Scan a folder once and return the set of names it contains."""
+    try:
+        with os.scandir(folder) as entries:
+            return {os.path.normcase(entry.name) for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+def reserve_filename(name_index, base_name, ext):
+    """Pick a filename not present in the index and record it as taken."""
+    filename = base_name + ext
+    counter = 1
+    while os.path.normcase(filename) in name_index:
+        filename = f"{base_name}_{counter}{ext}"
+        counter += 1
+    name_index.add(os.path.normcase(filename))
+    return filename
+
+def load_name_map(map_path):
+    """Load a saved URL -> filename mapping."""
+    try:
+        with open(map_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_name_map(map_path, name_map):
+    """Save a URL -> filename mapping, replacing the previous file atomically."""
+    tmp_path = map_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(name_map, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, map_path)
+
 def clean_filename(filename):
     """Clean filename and ensure it has the correct extension."""
     # Remove invalid characters
@@ -62,6 +104,16 @@ def get_file_extension_from_headers(headers):
     }
     return mime_to_ext.get(content_type, '')
 
+def get_download_priority(filename, content_type=None):
+    """Get the download priority class of a file from its Content-Type or extension."""
+    mime_type = (content_type or '').split(';')[0].strip().lower()
+    if not mime_type:
+        mime_type = EXTENSION_TO_MIME.get(os.path.splitext(filename)[1].lower(), '')
+    for prefix, priority in DOWNLOAD_PRIORITY_CLASSES.items():
+        if mime_type.startswith(prefix):
+            return priority
+    return DEFAULT_DOWNLOAD_PRIORITY
+
 def get_file_extension_from_content(file_start):
     """Get file extension by checking file signature."""
     for signature, extension in FILE_SIGNATURES.items():
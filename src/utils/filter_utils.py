@@ -0,0 +1,129 @@
+"""Download filters evaluated before any file request is made."""
+
+import re
+import datetime
+import email.utils
+from config.config import (
+    MIME_TO_EXTENSION,
+    FILTER_ALLOW_EXTENSIONS,
+    FILTER_DENY_EXTENSIONS,
+    FILTER_ALLOW_MIME_TYPES,
+    FILTER_DENY_MIME_TYPES,
+    FILTER_MAX_SIZE,
+    FILTER_SECTION_PATTERN,
+    FILTER_MODIFIED_AFTER
+)
+from src.utils.file_utils import EXTENSION_TO_MIME
+
+# Moodle activity icons (.../f/<name>-24) hint at a file's type without requesting it
+MOODLE_ICON_MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'document': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'powerpoint': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'spreadsheet': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'text': 'text/plain',
+    'image': 'image/jpeg',
+    'archive': 'application/zip',
+    'audio': 'audio/mpeg',
+    'video': 'video/mp4',
+    'mpeg': 'video/mp4',
+    'quicktime': 'video/quicktime'
+}
+MOODLE_ICON_PATTERN = re.compile(r'/f/([a-z]+)(?:-\d+)?(?:\.\w+)?$')
+
+SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+def parse_size(value):
+    """Parse a size such as '500000', '20M' or '1.5G' into bytes."""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?)i?B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()])
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD date into a UTC datetime."""
+    return datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+
+def split_values(values):
+    """Flatten a list of possibly comma-separated values."""
+    return [item.strip() for value in values for item in value.split(',') if item.strip()]
+
+def normalize_extension(extension):
+    """Lowercase an extension and add its leading dot, so 'PDF' and '.pdf' compare equal."""
+    extension = extension.lower()
+    return extension if extension.startswith('.') else '.' + extension
+
+def build_filters(allow_extensions=FILTER_ALLOW_EXTENSIONS, deny_extensions=FILTER_DENY_EXTENSIONS,
+                  allow_mime_types=FILTER_ALLOW_MIME_TYPES, deny_mime_types=FILTER_DENY_MIME_TYPES,
+                  max_size=FILTER_MAX_SIZE, section_pattern=FILTER_SECTION_PATTERN,
+                  modified_after=FILTER_MODIFIED_AFTER):
+    """Build a filter set. Empty lists and None values mean no restriction."""
+    return {
+        "allow_extensions": {normalize_extension(ext) for ext in split_values(allow_extensions)},
+        "deny_extensions": {normalize_extension(ext) for ext in split_values(deny_extensions)},
+        "allow_mime_types": {mime.lower() for mime in split_values(allow_mime_types)},
+        "deny_mime_types": {mime.lower() for mime in split_values(deny_mime_types)},
+        "max_size": parse_size(max_size) if max_size else None,
+        "section_pattern": re.compile(section_pattern, re.IGNORECASE) if section_pattern else None,
+        "modified_after": parse_date(modified_after) if modified_after else None
+    }
+
+def needs_metadata(filters):
+    """Whether the filters need size or modification date, which only a HEAD request can tell."""
+    return bool(filters["max_size"] or filters["modified_after"])
+
+def get_mime_type_from_icon(link):
+    """Guess a link's MIME type from the Moodle file-type icon inside it."""
+    icon = link.find("img", src=True)
+    if icon:
+        match = MOODLE_ICON_PATTERN.search(icon["src"].split('?')[0])
+        if match:
+            return MOODLE_ICON_MIME_TYPES.get(match.group(1))
+    return None
+
+def mime_matches(mime_type, patterns):
+    """Match a MIME type against patterns such as 'application/pdf' or 'video/*'."""
+    major_type = mime_type.split('/')[0]
+    return any(pattern == mime_type or pattern == f"{major_type}/*" for pattern in patterns)
+
+def rejects_type(filters, extension, mime_type):
+    """Return a reason if the type filters reject a file, or None. Unknown types are not rejected."""
+    extension = (extension or '').lower()
+    mime_type = (mime_type or '').split(';')[0].strip().lower()
+    if not extension and mime_type:
+        extension = MIME_TO_EXTENSION.get(mime_type, '')
+    if not mime_type and extension:
+        mime_type = EXTENSION_TO_MIME.get(extension, '')
+
+    if extension:
+        if extension in filters["deny_extensions"]:
+            return f"extension {extension} is denied"
+        if filters["allow_extensions"] and extension not in filters["allow_extensions"]:
+            return f"extension {extension} is not allowed"
+    if mime_type:
+        if mime_matches(mime_type, filters["deny_mime_types"]):
+            return f"type {mime_type} is denied"
+        if filters["allow_mime_types"] and not mime_matches(mime_type, filters["allow_mime_types"]):
+            return f"type {mime_type} is not allowed"
+    return None
+
+def rejects_section(filters, section_name):
+    """Return a reason if the section filter rejects a file, or None."""
+    if filters["section_pattern"] and not filters["section_pattern"].search(section_name or ''):
+        return f"section '{section_name}' does not match"
+    return None
+
+def rejects_metadata(filters, size=None, last_modified=None):
+    """Return a reason if size or date filters reject a file, or None. Unknown values are not rejected."""
+    if filters["max_size"] and size is not None and size > filters["max_size"]:
+        return f"size {size} exceeds {filters['max_size']} bytes"
+    if filters["modified_after"] and last_modified:
+        try:
+            modified = email.utils.parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return None
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+        if modified < filters["modified_after"]:
+            return f"last modified {modified.date()} is too old"
+    return None
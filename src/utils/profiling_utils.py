@@ -0,0 +1,78 @@
+"""Profiling utilities for the Moodle Downloader."""
+
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def record(name, seconds=0.0, count=1):
+    """Add a measurement to the named hot-path counter."""
+    with _stats_lock:
+        entry = _stats.setdefault(name, [0, 0.0])
+        entry[0] += count
+        entry[1] += seconds
+
+@contextmanager
+def timed(name):
+    """Time a block or, used as a decorator, every call of a function."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def get_timings():
+    """Return a snapshot of {name: (count, total_seconds)}."""
+    with _stats_lock:
+        return {name: tuple(entry) for name, entry in _stats.items()}
+
+def log_timings(level=logging.INFO):
+    """Log the collected timers, slowest first."""
+    timings = get_timings()
+    if not timings:
+        return
+    logger.log(level, "\nTiming summary (calls, total, average):")
+    for name, (count, total) in sorted(timings.items(), key=lambda item: item[1][1], reverse=True):
+        average = total / count if count else 0.0
+        logger.log(level, f"  {name:<20} {count:>7} {total:>10.3f}s {average:>9.4f}s")
+
+def run_profiled(func, stats_path=None, trace_memory=False, top=25):
+    """Run func under cProfile, optionally tracking peak memory with tracemalloc.
+
+    The stats file is standard pstats output, which snakeviz, flameprof and
+    gprof2dot can turn into call graphs or flamegraphs.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        # Snapshot memory before the reports below allocate anything
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(top)
+        logger.info(f"\nTop {top} functions by cumulative time:\n{output.getvalue()}")
+        if stats_path:
+            profiler.dump_stats(stats_path)
+            logger.info(f"Profile written to {stats_path}")
+
+        if trace_memory:
+            logger.info(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB")
+            for stat in snapshot.statistics("lineno")[:10]:
+                logger.info(f"  {stat}")
+
+        log_timings()
@@ -2,6 +2,7 @@
 
 import time
 import logging
+import threading
 import requests
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
@@ -9,11 +10,43 @@ from config.config import (
     RETRY_ATTEMPTS,
     RETRY_BACKOFF_FACTOR,
     RETRY_STATUS_FORCELIST,
-    REQUEST_DELAY
+    REQUEST_DELAY,
+    MAX_BANDWIDTH
 )
+from src.utils.profiling_utils import timed, record
 
 logger = logging.getLogger(__name__)
 
+class BandwidthLimiter:
+    """Global bytes-per-second cap shared by all active transfers.
+    
+    Each chunk reserves the next slot on a shared timeline under a lock, so
+    concurrent transfers are paced in turn and share the cap fairly. Time
+    spent receiving a chunk counts toward its budget, so a link only
+    slightly faster than the cap still runs at the cap.
+    """
+    
+    def __init__(self, max_bytes_per_second):
+        self.max_bytes_per_second = max_bytes_per_second
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, num_bytes):
+        """Block until num_bytes may be transferred without exceeding the cap."""
+        if self.max_bytes_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            duration = num_bytes / self.max_bytes_per_second
+            # The chunk was being received for up to its own budget before arriving here
+            self._next_slot = max(self._next_slot, now - duration) + duration
+            wait = self._next_slot - now
+        if wait > 0:
+            time.sleep(wait)
+            record("bandwidth_wait", wait)
+
+bandwidth_limiter = BandwidthLimiter(MAX_BANDWIDTH)
+
 def create_session():
     """Create a session with retry logic."""
     session = requests.Session()
@@ -32,14 +65,24 @@ def create_session():
     
     return session
 
-def safe_request(session, method, url, **kwargs):
-    """Make a request with proper error handling and delays."""
+def safe_request(session, method, url, raise_errors=False, **kwargs):
+    """Make a request with proper error handling and delays.
+    
+    Returns None on failure unless raise_errors is set (streaming requests always raise).
+    """
     try:
         # Add a small delay before each request
-        time.sleep(REQUEST_DELAY)
+        with timed("request_delay"):
+            time.sleep(REQUEST_DELAY)
         
         # Make the request
-        response = session.request(method, url, **kwargs)
+        with timed(f"http_{method.lower()}"):
+            response = session.request(method, url, **kwargs)
+        
+        # Count retries urllib3 performed inside the adapter
+        retries = getattr(response.raw, "retries", None)
+        if retries and retries.history:
+            record("http_retries", count=len(retries.history))
         response.raise_for_status()
         
         # For streaming requests, don't read the content here
@@ -52,6 +95,6 @@ def safe_request(session, method, url, **kwargs):
         return response
     except requests.exceptions.RequestException as e:
         logger.error(f"Request failed: {str(e)}")
-        if kwargs.get('stream'):
+        if raise_errors or kwargs.get('stream'):
             raise
         return None 
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""Output sinks that downloaded files are streamed into."""
+
+import io
+import os
+import json
+import logging
+import shutil
+import tarfile
+import time
+import zipfile
+from config.config import (
+    DOWNLOAD_FOLDER,
+    NAME_MAP_FILENAME,
+    OUTPUT_SINK,
+    S3_BUCKET,
+    S3_PREFIX,
+    S3_ENDPOINT_URL
+)
+from src.utils.file_utils import create_folder, build_filename_index, load_name_map, save_name_map
+
+logger = logging.getLogger(__name__)
+
+class ChunkReader(io.RawIOBase):
+    """Readable file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # Fill the whole buffer unless the chunks run out; tarfile treats short reads as EOF
+        filled = 0
+        while filled < len(b):
+            if not self._buffer:
+                try:
+                    self._buffer = next(self._chunks)
+                except StopIteration:
+                    break
+                continue
+            size = min(len(b) - filled, len(self._buffer))
+            b[filled:filled + size] = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            filled += size
+        return filled
+
+class LocalDirectorySink:
+    """Write files as loose files under a download folder, one folder per course."""
+
+    stores_local_files = True
+
+    def __init__(self, root=DOWNLOAD_FOLDER):
+        self.root = root
+
+    def course_folder(self, course_name):
+        return os.path.join(self.root, course_name)
+
+    def existing_names(self, course_name):
+        """Return the names already present for a course."""
+        return build_filename_index(self.course_folder(course_name))
+
+    def load_name_map(self, course_name):
+        return load_name_map(os.path.join(self.course_folder(course_name), NAME_MAP_FILENAME))
+
+    def save_name_map(self, course_name, name_map):
+        create_folder(self.course_folder(course_name))
+        save_name_map(os.path.join(self.course_folder(course_name), NAME_MAP_FILENAME), name_map)
+
+    def write(self, course_name, filename, chunks, size=None):
+        """Stream chunks into a file. Returns the path written."""
+        create_folder(self.course_folder(course_name))
+        file_path = os.path.join(self.course_folder(course_name), filename)
+        with open(file_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return file_path
+
+    def close(self):
+        pass
+
+class ArchiveSink:
+    """Stream files into one zip or tar archive per course.
+
+    Each run writes a fresh archive next to the old one and, on close, carries
+    over the old entries it did not rewrite before replacing it, so files that
+    fail or are filtered out this run keep their previous copy. Entries are
+    streamed straight into the archive, and one whose download fails midway
+    is truncated away again. Tar entries need their size up front, so
+    responses without a usable Content-Length are buffered in memory before
+    being added.
+    """
+
+    stores_local_files = False
+
+    def __init__(self, root=DOWNLOAD_FOLDER, archive_format="zip"):
+        if archive_format not in ("zip", "tar"):
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self.root = root
+        self.archive_format = archive_format
+        self._archives = {}
+        self._written = {}
+        self._names = {}
+
+    def archive_path(self, course_name):
+        return os.path.join(self.root, f"{course_name}.{self.archive_format}")
+
+    def _open_archive(self, path, mode):
+        if self.archive_format == "zip":
+            return zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED)
+        return tarfile.open(path, mode)
+
+    def _get_archive(self, course_name):
+        if course_name not in self._archives:
+            create_folder(self.root)
+            partial_path = self.archive_path(course_name) + ".partial"
+            self._archives[course_name] = self._open_archive(partial_path, "w")
+            self._written[course_name] = set()
+        return self._archives[course_name]
+
+    def existing_names(self, course_name):
+        """Return the names in this course's archive, from previous runs and this one."""
+        if course_name not in self._names:
+            names = set()
+            path = self.archive_path(course_name)
+            if os.path.exists(path):
+                with self._open_archive(path, "r") as archive:
+                    names = set(archive.namelist() if self.archive_format == "zip" else archive.getnames())
+            self._names[course_name] = {os.path.normcase(name) for name in names}
+        return set(self._names[course_name])
+
+    def load_name_map(self, course_name):
+        return load_name_map(self.archive_path(course_name) + NAME_MAP_FILENAME)
+
+    def save_name_map(self, course_name, name_map):
+        create_folder(self.root)
+        save_name_map(self.archive_path(course_name) + NAME_MAP_FILENAME, name_map)
+
+    def write(self, course_name, filename, chunks, size=None):
+        """Stream chunks into the course archive. Returns the entry location."""
+        archive = self._get_archive(course_name)
+        if self.archive_format == "zip":
+            # Closing the entry commits whatever was written, so roll back a transfer that fails midway
+            offset = archive.start_dir
+            previous = archive.NameToInfo.get(filename)
+            try:
+                with archive.open(filename, "w", force_zip64=True) as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+            except Exception:
+                archive.filelist = [info for info in archive.filelist if info.header_offset < offset]
+                if previous:
+                    archive.NameToInfo[filename] = previous
+                else:
+                    archive.NameToInfo.pop(filename, None)
+                archive.fp.seek(offset)
+                archive.fp.truncate()
+                archive.start_dir = offset
+                raise
+        else:
+            if size is None:
+                fileobj = io.BytesIO(b"".join(chunks))
+                size = len(fileobj.getbuffer())
+            else:
+                fileobj = ChunkReader(chunks)
+            info = tarfile.TarInfo(filename)
+            info.size = size
+            info.mtime = time.time()
+            # addfile writes the header before the data, so roll back a transfer that fails midway
+            offset = archive.offset
+            try:
+                archive.addfile(info, fileobj)
+            except Exception:
+                archive.fileobj.seek(offset)
+                archive.fileobj.truncate()
+                archive.offset = offset
+                raise
+        self._written[course_name].add(filename)
+        self._names.setdefault(course_name, set()).add(os.path.normcase(filename))
+        return f"{self.archive_path(course_name)}:{filename}"
+
+    def _carry_over(self, course_name, archive):
+        """Copy entries from the previous archive that were not rewritten this run."""
+        path = self.archive_path(course_name)
+        if not os.path.exists(path):
+            return
+        written = self._written[course_name]
+        with self._open_archive(path, "r") as previous:
+            if self.archive_format == "zip":
+                for info in previous.infolist():
+                    if info.filename not in written:
+                        with previous.open(info) as src, archive.open(info, "w", force_zip64=True) as dst:
+                            shutil.copyfileobj(src, dst)
+            else:
+                for member in previous.getmembers():
+                    if member.name not in written:
+                        archive.addfile(member, previous.extractfile(member) if member.isfile() else None)
+
+    def close(self):
+        for course_name, archive in self._archives.items():
+            try:
+                self._carry_over(course_name, archive)
+            finally:
+                archive.close()
+            os.replace(self.archive_path(course_name) + ".partial", self.archive_path(course_name))
+        self._archives = {}
+        self._written = {}
+
+class ObjectStoreSink:
+    """Stream files into an S3-compatible object store under <prefix>/<course>/<file>.
+
+    The client only needs the boto3 S3 client methods used here, so any
+    S3-compatible server (e.g. a local MinIO) can stand in for AWS.
+    """
+
+    stores_local_files = False
+
+    def __init__(self, client, bucket, prefix=""):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def key(self, course_name, filename):
+        return "/".join(part for part in (self.prefix, course_name, filename) if part)
+
+    def existing_names(self, course_name):
+        """Return the object names already stored for a course."""
+        course_prefix = self.key(course_name, "") + "/"
+        names = set()
+        kwargs = {"Bucket": self.bucket, "Prefix": course_prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            for obj in response.get("Contents", []):
+                names.add(os.path.normcase(obj["Key"][len(course_prefix):]))
+            if not response.get("IsTruncated"):
+                return names
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def load_name_map(self, course_name):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(course_name, NAME_MAP_FILENAME))
+            return json.loads(response["Body"].read())
+        except Exception:
+            return {}
+
+    def save_name_map(self, course_name, name_map):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.key(course_name, NAME_MAP_FILENAME),
+            Body=json.dumps(name_map, indent=2, sort_keys=True).encode("utf-8")
+        )
+
+    def write(self, course_name, filename, chunks, size=None):
+        """Stream chunks into an object. Returns the object URL."""
+        key = self.key(course_name, filename)
+        self.client.upload_fileobj(ChunkReader(chunks), self.bucket, key)
+        return f"s3://{self.bucket}/{key}"
+
+    def close(self):
+        pass
+
+def create_sink(kind=OUTPUT_SINK):
+    """Create the output sink configured by name: local, zip, tar or s3."""
+    if kind == "local":
+        return LocalDirectorySink()
+    if kind in ("zip", "tar"):
+        return ArchiveSink(archive_format=kind)
+    if kind == "s3":
+        if not S3_BUCKET:
+            raise ValueError("MOODLE_S3_BUCKET must be set to use the s3 output sink")
+        try:
+            import boto3
+        except ImportError:
+            raise ValueError("The s3 output sink requires boto3 (pip install boto3)")
+        client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+        return ObjectStoreSink(client, S3_BUCKET, S3_PREFIX)
+    raise ValueError(f"Unknown output sink: {kind}")
@@ -0,0 +1,39 @@
+"""URL normalization utilities for the Moodle Downloader."""
+
+import re
+import urllib.parse
+
+# Query parameters that change how a file is served, not which file it is
+IGNORED_QUERY_PARAMS = {'forcedownload', 'token', 'redirect', 'embed', 'preview'}
+
+# /pluginfile.php/<context>/mod_resource/content/<revision>/<path>: the revision is bumped when the
+# file is replaced, so it identifies a version of the file rather than the file itself
+RESOURCE_REVISION_PATTERN = re.compile(r'(/pluginfile\.php/\d+/mod_resource/content/)(\d+)(/)')
+
+def get_resource_revision(url):
+    """Return the revision number in a resource file URL, or None if it has none."""
+    match = RESOURCE_REVISION_PATTERN.search(urllib.parse.unquote(urllib.parse.urlparse(url).path))
+    return int(match.group(2)) if match else None
+
+def canonicalize_url(url):
+    """Normalize a Moodle file URL so every link to the same file compares equal."""
+    parsed = urllib.parse.urlparse(url)
+
+    path = urllib.parse.unquote(parsed.path)
+    path = path.replace('/webservice/pluginfile.php', '/pluginfile.php')
+    path = RESOURCE_REVISION_PATTERN.sub(r'\g<1>0\g<3>', path)
+
+    query = sorted(
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in IGNORED_QUERY_PARAMS
+    )
+
+    return urllib.parse.urlunparse((
+        parsed.scheme.lower(),
+        parsed.netloc.lower(),
+        urllib.parse.quote(path),
+        '',
+        urllib.parse.urlencode(query),
+        ''
+    ))
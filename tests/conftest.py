@@ -0,0 +1,7 @@
+"""Test configuration for the Moodle Downloader."""
+
+import os
+import sys
+
+# Add the project root directory to Python path, as src/main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
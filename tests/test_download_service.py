@@ -0,0 +1,206 @@
+"""Tests for the download service, run against an in-memory fake Moodle."""
+
+import tarfile
+import urllib.parse
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+from src.utils import request_utils
+from src.utils.sink_utils import LocalDirectorySink, ArchiveSink
+from src.utils.filter_utils import build_filters
+from src.services import download_service
+from src.services.download_service import (
+    discover_course_files,
+    download_file,
+    make_download_job,
+    download_priority_key,
+    retry_failed_downloads
+)
+
+COURSE_PAGE = """<html><title>Course: Signals 101</title><body>
+<li class="section" data-sectionname="Week 1">
+<a href="/pluginfile.php/9/mod_resource/content/3/notes.pdf">notes.pdf</a>
+</li>
+</body></html>"""
+
+FILES = {
+    "/pluginfile.php/9/mod_resource/content/3/notes.pdf": (b"%PDF-1.4 " + b"x" * 200, "application/pdf")
+}
+
+class FakeMoodleSession:
+    """Serves a course page and files, recording every request made."""
+
+    def __init__(self, page=COURSE_PAGE, files=FILES, last_modified=None, redirects=None, fail_heads=False):
+        self.page = page
+        self.fail_heads = fail_heads
+        self.files = files
+        self.last_modified = last_modified
+        self.redirects = redirects or {}
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        path = urllib.parse.urlparse(url).path
+        if self.fail_heads and method == "HEAD":
+            raise requests.exceptions.ConnectionError("connection reset")
+        if path in self.redirects:
+            path = self.redirects[path]
+            url = urllib.parse.urljoin(url, path)
+        response = requests.Response()
+        response.url = url
+        response.headers = CaseInsensitiveDict()
+        response.status_code = 200
+        if path == "/course/view.php":
+            body, content_type = self.page.encode(), "text/html"
+        elif path in self.files:
+            body, content_type = self.files[path]
+        else:
+            body, content_type = b"", "text/html"
+            response.status_code = 404
+        response.headers["Content-Type"] = content_type
+        response.headers["Content-Length"] = str(len(body))
+        if self.last_modified:
+            response.headers["Last-Modified"] = self.last_modified
+        response._content = b"" if method == "HEAD" else body
+        response._content_consumed = True
+        return response
+
+@pytest.fixture(autouse=True)
+def no_request_delay(monkeypatch):
+    monkeypatch.setattr(request_utils, "REQUEST_DELAY", 0)
+
+TWO_SECTION_PAGE = """<html><title>Course: Signals 101</title><body>
+<li class="section" data-sectionname="Week 1">
+<a href="/pluginfile.php/9/mod_resource/content/3/notes.pdf">notes.pdf</a>
+</li>
+<li class="section" data-sectionname="Week 2">
+<a href="/pluginfile.php/9/mod_resource/content/3/notes.pdf?forcedownload=1">notes.pdf</a>
+</li>
+</body></html>"""
+
+OLD_DATE = "Mon, 01 Sep 2025 09:00:00 GMT"
+NEW_DATE = "Mon, 02 Mar 2026 09:00:00 GMT"
+
+VIEW_LINK_PAGE = """<html><title>Course: Signals 101</title><body>
+<li class="section" data-sectionname="Week 1">
+<a href="/mod/resource/view.php?id=5">Lecture slides week one</a>
+</li>
+</body></html>"""
+VIEW_REDIRECTS = {"/mod/resource/view.php": "/pluginfile.php/9/mod_resource/content/3/notes.pdf"}
+
+def head_requests(session):
+    return [url for method, url in session.requests if method == "HEAD"]
+
+def test_repeat_run_finds_remembered_files_again(tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+
+    first_session = FakeMoodleSession()
+    first = discover_course_files(first_session, 7, sink)
+    second_session = FakeMoodleSession()
+    second = discover_course_files(second_session, 7, sink)
+
+    assert [job["filename"] for job in first] == ["notes.pdf"]
+    assert [job["filename"] for job in second] == ["notes.pdf"]
+    # The second run reuses the remembered name without asking the server again
+    assert head_requests(first_session)
+    assert not head_requests(second_session)
+
+def test_section_filter_keeps_file_also_linked_from_other_section(tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+    filters = build_filters(section_pattern="week 2")
+
+    for run in range(2):
+        session = FakeMoodleSession(page=TWO_SECTION_PAGE)
+        jobs = discover_course_files(session, 7, sink, filters=filters)
+        assert [job["filename"] for job in jobs] == ["notes.pdf"], f"run {run + 1}"
+
+def test_new_revision_refreshes_cached_metadata(tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+    filters = build_filters(modified_after="2026-01-01")
+    discover_course_files(FakeMoodleSession(last_modified=OLD_DATE), 7, sink)
+
+    # Same revision: the cached date rejects the file without asking the server
+    session = FakeMoodleSession(last_modified=OLD_DATE)
+    assert discover_course_files(session, 7, sink, filters=filters) == []
+    assert not head_requests(session)
+
+    # The teacher replaced the file, so Moodle now links revision 4
+    updated_page = COURSE_PAGE.replace("/content/3/", "/content/4/")
+    updated_files = {path.replace("/content/3/", "/content/4/"): file for path, file in FILES.items()}
+    session = FakeMoodleSession(page=updated_page, files=updated_files, last_modified=NEW_DATE)
+    jobs = discover_course_files(session, 7, sink, filters=filters)
+    assert [job["filename"] for job in jobs] == ["notes.pdf"]
+
+def test_view_link_rechecks_before_rejecting_on_cached_date(tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+    filters = build_filters(modified_after="2026-01-01")
+    page = COURSE_PAGE.replace("/pluginfile.php/9/mod_resource/content/3/notes.pdf", "/mod/resource/view.php?id=5")
+    redirects = {"/mod/resource/view.php": "/pluginfile.php/9/mod_resource/content/3/notes.pdf"}
+    discover_course_files(FakeMoodleSession(page=page, last_modified=OLD_DATE, redirects=redirects), 7, sink)
+
+    session = FakeMoodleSession(page=page, last_modified=NEW_DATE, redirects=redirects)
+    jobs = discover_course_files(session, 7, sink, filters=filters)
+    assert [job["filename"] for job in jobs] == ["notes.pdf"]
+
+def test_failed_head_records_the_http_error(tmp_path):
+    page = COURSE_PAGE.replace("notes.pdf", "missing.pdf")
+    failures = {}
+    jobs = discover_course_files(FakeMoodleSession(page=page), 7, LocalDirectorySink(str(tmp_path)), failures=failures)
+
+    assert jobs == []
+    assert [entry["error"] for entry in failures.values()] == ["HTTPError 404"]
+
+def test_tar_entry_is_sized_from_the_response_not_the_cached_size(tmp_path):
+    sink = ArchiveSink(str(tmp_path), "tar")
+    path = "/pluginfile.php/9/mod_resource/content/3/notes.pdf"
+    body = FILES[path][0]
+    # The cached size is from an older, smaller revision of the file
+    job = make_download_job("https://moodle.example.com" + path, 7, "Signals 101", "notes.pdf", size=len(body) - 100)
+
+    download_file(FakeMoodleSession(), sink, job)
+    sink.close()
+
+    with tarfile.open(sink.archive_path("Signals 101")) as archive:
+        assert archive.extractfile("notes.pdf").read() == body
+
+def test_name_guessed_after_failed_head_is_fixed_by_next_discovery(tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+    failures = {}
+    session = FakeMoodleSession(page=VIEW_LINK_PAGE, redirects=VIEW_REDIRECTS, fail_heads=True)
+    assert discover_course_files(session, 7, sink, failures=failures) == []
+    assert [entry["error"] for entry in failures.values()] == ["ConnectionError"]
+
+    session = FakeMoodleSession(page=VIEW_LINK_PAGE, redirects=VIEW_REDIRECTS)
+    jobs = discover_course_files(session, 7, sink)
+    assert [job["filename"] for job in jobs] == ["Lecture slides week one.pdf"]
+
+@pytest.mark.parametrize("max_size, expected", [(None, ["Lecture slides week one.pdf"]), ("100", [])])
+def test_queued_job_without_metadata_is_checked_before_download(tmp_path, monkeypatch, max_size, expected):
+    monkeypatch.setattr(download_service, "RETRY_PASS_BACKOFF", 0)
+    sink = LocalDirectorySink(str(tmp_path))
+    failures = {}
+    session = FakeMoodleSession(page=VIEW_LINK_PAGE, redirects=VIEW_REDIRECTS, fail_heads=True)
+    discover_course_files(session, 7, sink, failures=failures)
+
+    session = FakeMoodleSession(page=VIEW_LINK_PAGE, redirects=VIEW_REDIRECTS)
+    retry_failed_downloads(session, sink, failures, filters=build_filters(max_size=max_size))
+
+    assert sorted(path.name for path in (tmp_path / "Signals 101").iterdir() if path.name != ".moodle_names.json") == expected
+    assert failures == {}
+    if not expected:
+        assert [method for method, _ in session.requests] == ["HEAD"]
+    else:
+        # The retry settled the name, so the next run reuses it without a HEAD
+        session = FakeMoodleSession(page=VIEW_LINK_PAGE, redirects=VIEW_REDIRECTS)
+        assert [job["filename"] for job in discover_course_files(session, 7, sink)] == expected
+        assert not head_requests(session)
+
+def test_documents_download_first_smallest_known_size_first():
+    jobs = [
+        make_download_job("u1", 7, "Signals 101", "lecture.mp4", size=10),
+        make_download_job("u2", 7, "Signals 101", "unknown.pdf"),
+        make_download_job("u3", 7, "Signals 101", "big.pdf", size=5000),
+        make_download_job("u4", 7, "Signals 101", "small", content_type="application/pdf", size=200)
+    ]
+    ordered = [job["filename"] for job in sorted(jobs, key=download_priority_key)]
+    assert ordered == ["small", "big.pdf", "unknown.pdf", "lecture.mp4"]
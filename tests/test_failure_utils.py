@@ -0,0 +1,41 @@
+"""Tests for the persistent failure queue."""
+
+import json
+import requests
+from src.utils.failure_utils import load_failures, record_failure, failure_key, describe_error
+
+FILE_URL = "https://moodle.example.com/pluginfile.php/9/mod_resource/content/3/notes.pdf"
+
+def make_job(url):
+    return {"url": url, "course_id": 7, "course_name": "Signals 101", "filename": "notes.pdf",
+            "priority": 0, "size": None}
+
+def test_links_to_the_same_file_share_one_entry():
+    failures = {}
+    record_failure(failures, make_job(FILE_URL + "?forcedownload=1"), "ConnectionError")
+    record_failure(failures, make_job(FILE_URL.replace("/content/3/", "/content/4/")), "ConnectionError")
+
+    assert len(failures) == 1
+    assert failures[failure_key(make_job(FILE_URL))]["attempts"] == 2
+
+def test_load_rekeys_queues_saved_with_raw_urls(tmp_path):
+    queue_path = str(tmp_path / "failures.json")
+    raw_url = FILE_URL + "?forcedownload=1"
+    with open(queue_path, "w") as f:
+        json.dump({raw_url: dict(make_job(raw_url), attempts=1)}, f)
+
+    assert list(load_failures(queue_path)) == [failure_key(make_job(FILE_URL))]
+
+def test_describe_error_includes_http_status():
+    response = requests.Response()
+    response.status_code = 404
+    assert describe_error(requests.exceptions.HTTPError("Not Found", response=response)) == "HTTPError 404"
+    assert describe_error(requests.exceptions.ConnectionError("refused")) == "ConnectionError"
+
+def test_entries_are_parked_after_max_attempts():
+    failures = {}
+    for _ in range(2):
+        entry = record_failure(failures, make_job(FILE_URL), "ConnectionError", max_attempts=3)
+        assert not entry.get("parked")
+    entry = record_failure(failures, make_job(FILE_URL), "ConnectionError", max_attempts=3)
+    assert entry["parked"]
@@ -0,0 +1,52 @@
+"""Tests for the search index service."""
+
+import os
+from src.services.index_service import update_index, search, connect_index, find_indexable_files
+
+def rewrite(path, text, mtime_ns):
+    with open(path, "w") as f:
+        f.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_rewritten_file_is_only_reindexed_when_content_changes(tmp_path):
+    index_path = str(tmp_path / "index.db")
+    path = str(tmp_path / "notes.txt")
+
+    rewrite(path, "fourier transform", 1_000_000_000)
+    assert update_index([path], index_path) == 1
+
+    # A re-download rewrites the file with a new mtime but the same bytes
+    rewrite(path, "fourier transform", 2_000_000_000)
+    assert update_index([path], index_path) == 0
+    assert update_index([path], index_path) == 0
+
+    rewrite(path, "laplace transform", 3_000_000_000)
+    assert update_index([path], index_path) == 1
+    assert [hit[0] for hit in search("laplace", index_path=index_path)] == [path]
+    assert search("fourier", index_path=index_path) == []
+
+def test_deleted_files_are_removed_from_index(tmp_path):
+    index_path = str(tmp_path / "index.db")
+    kept, deleted = str(tmp_path / "kept.txt"), str(tmp_path / "deleted.txt")
+    rewrite(kept, "sampling theorem", 1_000_000_000)
+    rewrite(deleted, "sampling rate", 1_000_000_000)
+    update_index([kept, deleted], index_path)
+
+    os.remove(deleted)
+    update_index([], index_path)
+
+    assert [hit[0] for hit in search("sampling", index_path=index_path)] == [kept]
+    conn = connect_index(index_path)
+    try:
+        assert conn.execute("SELECT path FROM files").fetchall() == [(kept,)]
+    finally:
+        conn.close()
+
+def test_find_indexable_files_skips_the_downloaders_own_files(tmp_path):
+    course = tmp_path / "Signals 101"
+    course.mkdir()
+    (course / "notes.txt").write_text("fourier")
+    (course / ".moodle_names.json").write_text('{"fourier": {"name": "notes.txt"}}')
+    (tmp_path / ".failed_downloads.json").write_text("{}")
+
+    assert find_indexable_files(str(tmp_path)) == [str(course / "notes.txt")]
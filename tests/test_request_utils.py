@@ -0,0 +1,39 @@
+"""Tests for request helpers."""
+
+import pytest
+from src.utils import request_utils
+from src.utils.request_utils import BandwidthLimiter
+
+class FakeClock:
+    """Stands in for the time module: sleeping just advances the clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(request_utils, "time", clock)
+    return clock
+
+@pytest.mark.parametrize("receive_seconds", [0.0, 0.5, 0.9])
+def test_bandwidth_limiter_holds_the_cap(clock, receive_seconds):
+    limiter = BandwidthLimiter(1000)
+    for _ in range(10):
+        # Receiving each 1000-byte chunk takes receive_seconds on the link
+        clock.now += receive_seconds
+        limiter.consume(1000)
+    assert clock.now == pytest.approx(10.0)
+
+def test_bandwidth_limiter_does_not_slow_a_link_below_the_cap(clock):
+    limiter = BandwidthLimiter(1000)
+    for _ in range(10):
+        clock.now += 2.0
+        limiter.consume(1000)
+    assert clock.now == pytest.approx(20.0)
@@ -0,0 +1,95 @@
+"""Tests for the archive output sink."""
+
+import io
+import tarfile
+import zipfile
+import pytest
+from src.utils.sink_utils import ArchiveSink, ObjectStoreSink
+
+def failing_chunks():
+    yield b"partial data"
+    raise ConnectionError("connection dropped")
+
+def read_archive(path, archive_format):
+    if archive_format == "zip":
+        with zipfile.ZipFile(path) as archive:
+            assert archive.testzip() is None
+            entries = [(name, archive.read(name)) for name in archive.namelist()]
+    else:
+        with tarfile.open(path) as archive:
+            entries = [(member.name, archive.extractfile(member).read()) for member in archive.getmembers()]
+    names = [name for name, _ in entries]
+    assert len(names) == len(set(names)), f"duplicate entries: {names}"
+    return dict(entries)
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client methods the sink uses."""
+
+    def __init__(self, page_size=2):
+        self.objects = {}
+        self.page_size = page_size
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(key for (bucket, key) in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {"Contents": [{"Key": key} for key in page], "IsTruncated": start + self.page_size < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + self.page_size)
+        return response
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        self.objects[(Bucket, Key)] = Fileobj.read()
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar"])
+def test_failed_transfer_leaves_no_entry(tmp_path, archive_format):
+    sink = ArchiveSink(str(tmp_path), archive_format)
+    with pytest.raises(ConnectionError):
+        sink.write("Course", "slides.pdf", failing_chunks(), size=100)
+    # The retry of the same file must not collide with or follow a broken entry
+    sink.write("Course", "slides.pdf", [b"complete"], size=8)
+    sink.close()
+
+    assert read_archive(sink.archive_path("Course"), archive_format) == {"slides.pdf": b"complete"}
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar"])
+def test_rerun_keeps_files_not_rewritten(tmp_path, archive_format):
+    first = ArchiveSink(str(tmp_path), archive_format)
+    first.write("Course", "notes.pdf", [b"old notes"], size=9)
+    first.write("Course", "video.mp4", [b"old video"], size=9)
+    first.close()
+
+    second = ArchiveSink(str(tmp_path), archive_format)
+    assert second.existing_names("Course") == {"notes.pdf", "video.mp4"}
+    second.write("Course", "notes.pdf", [b"new notes"], size=9)
+    with pytest.raises(ConnectionError):
+        second.write("Course", "video.mp4", failing_chunks(), size=100)
+    second.close()
+
+    assert read_archive(second.archive_path("Course"), archive_format) == {
+        "notes.pdf": b"new notes",
+        "video.mp4": b"old video"
+    }
+
+def test_object_store_sink_round_trip():
+    client = FakeS3Client()
+    sink = ObjectStoreSink(client, "bucket", "/moodle/")
+    for name in ("a.pdf", "b.pdf", "c.mp4"):
+        assert sink.write("Course", name, [b"data ", name.encode()]) == f"s3://bucket/moodle/Course/{name}"
+    # Another course whose name shares a prefix must not leak into the listing
+    sink.write("Course 2", "other.pdf", [b"x"])
+
+    assert client.objects[("bucket", "moodle/Course/c.mp4")] == b"data c.mp4"
+    assert sink.existing_names("Course") == {"a.pdf", "b.pdf", "c.mp4"}
+
+    assert sink.load_name_map("Course") == {}
+    sink.save_name_map("Course", {"https://moodle/x": {"name": "a.pdf"}})
+    assert sink.load_name_map("Course") == {"https://moodle/x": {"name": "a.pdf"}}